@@ -1,214 +1,311 @@
-# Import all our protocol functions
-from protocol import get_info
-from protocol import get_head_position
-from protocol import get_temp
-from protocol import get_progress
-from protocol import get_status
-from protocol import home_printer
-from protocol import move_axis
-from protocol import set_led_color
-from protocol import pause_print
-from protocol import resume_print
-from protocol import stop_print
-from protocol import upload_file
-
-from flask import Flask, jsonify, request
-from flask_cors import CORS
-
-app = Flask(__name__)
-CORS(app)  # Allow requests from browsers
-
-PORT = 8899  # FlashForge Finder's TCP port
-
-
-@app.route("/")
-def index():
-    """Root endpoint - just returns empty string"""
-    return ''
-
-
-@app.route("/<string:ip_address>/info")
-def info(ip_address):
-    """GET /10.0.0.96/info
-    Returns printer info like firmware version, model, etc.
-    """
-    try:
-        printer_info = get_info({'ip': ip_address, 'port': PORT})
-        return jsonify(printer_info)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/head-location")
-def head_location(ip_address):
-    """GET /10.0.0.96/head-location
-    Where is the print head right now? Returns X, Y, Z coordinates
-    """
-    try:
-        printer_info = get_head_position({'ip': ip_address, 'port': PORT})
-        return jsonify(printer_info)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/temp")
-def temp(ip_address):
-    """GET /10.0.0.96/temp
-    Current and target temperatures for extruder and bed
-    """
-    try:
-        printer_info = get_temp({'ip': ip_address, 'port': PORT})
-        return jsonify(printer_info)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/progress")
-def progress(ip_address):
-    """GET /10.0.0.96/progress
-    How far into the current print? Returns bytes and percentage
-    """
-    try:
-        printer_info = get_progress({'ip': ip_address, 'port': PORT})
-        return jsonify(printer_info)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/status")
-def status(ip_address):
-    """GET /10.0.0.96/status
-    General printer status - endstops, etc.
-    """
-    try:
-        printer_info = get_status({'ip': ip_address, 'port': PORT})
-        return jsonify(printer_info)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/home", methods=['POST'])
-def home(ip_address):
-    """POST /10.0.0.96/home
-    Home all axes, or send {"axis": "Z"} to home just one
-    """
-    try:
-        # If JSON is sent, look for 'axis' field, otherwise home everything
-        axis = request.json.get('axis', 'all') if request.is_json else 'all'
-        result = home_printer({'ip': ip_address, 'port': PORT}, axis)
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/move", methods=['POST'])
-def move(ip_address):
-    """POST /10.0.0.96/move
-    Move to a position
-    Expects JSON: {"x": 10, "y": 20, "z": 5, "speed": 3000}
-    You can leave out any coordinate to keep it at current position
-    """
-    try:
-        if not request.is_json:
-            return jsonify({'error': 'Request must be JSON'}), 400
-
-        data = request.json
-        x = data.get('x')  # None if not provided
-        y = data.get('y')
-        z = data.get('z')
-        speed = data.get('speed', 3000)  # Default to 3000 mm/min
-
-        result = move_axis({'ip': ip_address, 'port': PORT}, x, y, z, speed)
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/led", methods=['POST'])
-def led(ip_address):
-    """POST /10.0.0.96/led
-    Change LED color
-    Expects JSON: {"r": 255, "g": 0, "b": 0}
-    Values are 0-255 like normal RGB
-    """
-    try:
-        if not request.is_json:
-            return jsonify({'error': 'Request must be JSON'}), 400
-
-        data = request.json
-        r = data.get('r', 0)  # Default to 0 if not provided
-        g = data.get('g', 0)
-        b = data.get('b', 0)
-
-        result = set_led_color({'ip': ip_address, 'port': PORT}, r, g, b)
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/pause", methods=['POST'])
-def pause(ip_address):
-    """POST /10.0.0.96/pause
-    Pause whatever's printing right now
-    """
-    try:
-        result = pause_print({'ip': ip_address, 'port': PORT})
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/resume", methods=['POST'])
-def resume(ip_address):
-    """POST /10.0.0.96/resume
-    Continue a paused print
-    """
-    try:
-        result = resume_print({'ip': ip_address, 'port': PORT})
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/stop", methods=['POST'])
-def stop(ip_address):
-    """POST /10.0.0.96/stop
-    Stop the print completely - this cancels it
-    """
-    try:
-        result = stop_print({'ip': ip_address, 'port': PORT})
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route("/<string:ip_address>/upload", methods=['POST'])
-def upload(ip_address):
-    """POST /10.0.0.96/upload
-    Upload a gcode file to the printer
-    Send as multipart/form-data with file field named 'file'
-
-    Note: Currently gives CRC errors on the printer - still debugging
-    """
-    try:
-        # Make sure they actually sent a file
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-
-        # Read the whole file into memory
-        file_content = file.read()
-        filename = file.filename
-
-        result = upload_file({'ip': ip_address, 'port': PORT}, filename, file_content)
-        return jsonify({'success': True, 'response': result})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-if __name__ == '__main__':
-    # Run the Flask server in debug mode
-    app.run(debug=True)
\ No newline at end of file
+import asyncio
+import os
+
+# Import all our protocol functions
+from protocol import get_info
+from protocol import get_head_position
+from protocol import get_temp
+from protocol import get_progress
+from protocol import get_status
+from protocol import home_printer
+from protocol import move_axis
+from protocol import set_led_color
+from protocol import pause_print
+from protocol import resume_print
+from protocol import stop_print
+from protocol import upload_file
+
+from json_provider import OrjsonProvider
+
+from quart import Quart, jsonify, request
+from quart_cors import cors
+from werkzeug.exceptions import RequestEntityTooLarge
+
+app = Quart(__name__)
+app.json = OrjsonProvider(app)  # Faster JSON for every jsonify() below
+app = cors(app)  # Allow requests from browsers
+
+PORT = 8899  # FlashForge Finder's TCP port
+MAX_BATCH_PRINTERS = 32  # Most printers one batch request (POST /temp etc.) can ask about
+MAX_UPLOAD_SIZE = 512 * 1024 * 1024  # Biggest gcode file /upload accepts (512MB)
+
+# Quart's defaults (16MB bodies, 60 seconds per request) are too small for gcode uploads
+# Uploads get spooled to a temp file, not memory, so a big cap is fine
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
+# No overall time limit for receiving the file or sending it on to the printer -
+# a big file over a slow link takes a while, and every printer step has its own timeout
+app.config['BODY_TIMEOUT'] = None
+app.config['RESPONSE_TIMEOUT'] = None
+
+
+async def ask_every_printer(query):
+    """Run one status query on several printers at the same time
+    Reads {"ips": [...]} from the request body and returns {ip: result}
+    A printer that fails just gets {"error": ...} instead of failing the whole batch
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Request must be JSON'}), 400
+
+        data = await request.get_json()
+        ips = data.get('ips') if isinstance(data, dict) else None
+        if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+            return jsonify({'error': 'Expected a list of printer IPs in "ips"'}), 400
+        # Every printer we talk to keeps an open connection around, so don't let one request ask hundreds
+        if len(ips) > MAX_BATCH_PRINTERS:
+            return jsonify({'error': f'At most {MAX_BATCH_PRINTERS} printers per request'}), 400
+
+        # All printers get asked at once, so this takes as long as the slowest one - not the sum
+        results = await asyncio.gather(*(query({'ip': ip, 'port': PORT}) for ip in ips), return_exceptions=True)
+        return jsonify({ip: {'error': str(result)} if isinstance(result, Exception) else result
+                        for ip, result in zip(ips, results)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/")
+async def index():
+    """Root endpoint - just returns empty string"""
+    return ''
+
+
+@app.route("/<string:ip_address>/info")
+async def info(ip_address):
+    """GET /10.0.0.96/info
+    Returns printer info like firmware version, model, etc.
+    """
+    try:
+        printer_info = await get_info({'ip': ip_address, 'port': PORT})
+        return jsonify(printer_info)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/head-location")
+async def head_location(ip_address):
+    """GET /10.0.0.96/head-location
+    Where is the print head right now? Returns X, Y, Z coordinates
+    """
+    try:
+        printer_info = await get_head_position({'ip': ip_address, 'port': PORT})
+        return jsonify(printer_info)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/temp")
+async def temp(ip_address):
+    """GET /10.0.0.96/temp
+    Current and target temperatures for extruder and bed
+    """
+    try:
+        printer_info = await get_temp({'ip': ip_address, 'port': PORT})
+        return jsonify(printer_info)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/progress")
+async def progress(ip_address):
+    """GET /10.0.0.96/progress
+    How far into the current print? Returns bytes and percentage
+    """
+    try:
+        printer_info = await get_progress({'ip': ip_address, 'port': PORT})
+        return jsonify(printer_info)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/status")
+async def status(ip_address):
+    """GET /10.0.0.96/status
+    General printer status - endstops, etc.
+    """
+    try:
+        printer_info = await get_status({'ip': ip_address, 'port': PORT})
+        return jsonify(printer_info)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/info", methods=['POST'])
+async def batch_info():
+    """POST /info
+    Printer info for several printers at once
+    Expects JSON: {"ips": ["10.0.0.96", "10.0.0.97"]}
+    """
+    return await ask_every_printer(get_info)
+
+
+@app.route("/head-location", methods=['POST'])
+async def batch_head_location():
+    """POST /head-location
+    Print head positions for several printers at once
+    Expects JSON: {"ips": ["10.0.0.96", "10.0.0.97"]}
+    """
+    return await ask_every_printer(get_head_position)
+
+
+@app.route("/temp", methods=['POST'])
+async def batch_temp():
+    """POST /temp
+    Temperatures for several printers at once
+    Expects JSON: {"ips": ["10.0.0.96", "10.0.0.97"]}
+    """
+    return await ask_every_printer(get_temp)
+
+
+@app.route("/progress", methods=['POST'])
+async def batch_progress():
+    """POST /progress
+    Print progress for several printers at once
+    Expects JSON: {"ips": ["10.0.0.96", "10.0.0.97"]}
+    """
+    return await ask_every_printer(get_progress)
+
+
+@app.route("/status", methods=['POST'])
+async def batch_status():
+    """POST /status
+    General status for several printers at once
+    Expects JSON: {"ips": ["10.0.0.96", "10.0.0.97"]}
+    """
+    return await ask_every_printer(get_status)
+
+
+@app.route("/<string:ip_address>/home", methods=['POST'])
+async def home(ip_address):
+    """POST /10.0.0.96/home
+    Home all axes, or send {"axis": "Z"} to home just one
+    """
+    try:
+        # If JSON is sent, look for 'axis' field, otherwise home everything
+        axis = (await request.get_json()).get('axis', 'all') if request.is_json else 'all'
+        result = await home_printer({'ip': ip_address, 'port': PORT}, axis)
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/move", methods=['POST'])
+async def move(ip_address):
+    """POST /10.0.0.96/move
+    Move to a position
+    Expects JSON: {"x": 10, "y": 20, "z": 5, "speed": 3000}
+    You can leave out any coordinate to keep it at current position
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Request must be JSON'}), 400
+
+        data = await request.get_json()
+        x = data.get('x')  # None if not provided
+        y = data.get('y')
+        z = data.get('z')
+        speed = data.get('speed', 3000)  # Default to 3000 mm/min
+
+        result = await move_axis({'ip': ip_address, 'port': PORT}, x, y, z, speed)
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/led", methods=['POST'])
+async def led(ip_address):
+    """POST /10.0.0.96/led
+    Change LED color
+    Expects JSON: {"r": 255, "g": 0, "b": 0}
+    Values are 0-255 like normal RGB
+    """
+    try:
+        if not request.is_json:
+            return jsonify({'error': 'Request must be JSON'}), 400
+
+        data = await request.get_json()
+        r = data.get('r', 0)  # Default to 0 if not provided
+        g = data.get('g', 0)
+        b = data.get('b', 0)
+
+        result = await set_led_color({'ip': ip_address, 'port': PORT}, r, g, b)
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/pause", methods=['POST'])
+async def pause(ip_address):
+    """POST /10.0.0.96/pause
+    Pause whatever's printing right now
+    """
+    try:
+        result = await pause_print({'ip': ip_address, 'port': PORT})
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/resume", methods=['POST'])
+async def resume(ip_address):
+    """POST /10.0.0.96/resume
+    Continue a paused print
+    """
+    try:
+        result = await resume_print({'ip': ip_address, 'port': PORT})
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/stop", methods=['POST'])
+async def stop(ip_address):
+    """POST /10.0.0.96/stop
+    Stop the print completely - this cancels it
+    """
+    try:
+        result = await stop_print({'ip': ip_address, 'port': PORT})
+        return jsonify({'success': True, 'response': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route("/<string:ip_address>/upload", methods=['POST'])
+async def upload(ip_address):
+    """POST /10.0.0.96/upload
+    Upload a gcode file to the printer
+    Send as multipart/form-data with file field named 'file'
+
+    Note: Currently gives CRC errors on the printer - still debugging
+    """
+    try:
+        # Make sure they actually sent a file
+        files = await request.files
+        if 'file' not in files:
+            return jsonify({'error': 'No file provided'}), 400
+
+        file = files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        # Hand over the upload's stream instead of reading it all into memory
+        # The printer wants the exact size first, so measure it by seeking to the end
+        stream = file.stream
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        filename = file.filename
+
+        result = await upload_file({'ip': ip_address, 'port': PORT}, filename, stream, size)
+        return jsonify({'success': True, 'response': result})
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'File too large, the limit is {MAX_UPLOAD_SIZE // (1024 * 1024)}MB'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+if __name__ == '__main__':
+    # Serve with Uvicorn rather than the debug dev server - one event loop
+    # handles all the printer requests concurrently
+    # Deliberately a single worker: printer connections and the status cache
+    # live in this process, extra workers would each open their own
+    import uvicorn
+    uvicorn.run(app, host='127.0.0.1', port=5000)
\ No newline at end of file
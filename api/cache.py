@@ -0,0 +1,70 @@
+import asyncio
+import functools
+
+from cachetools import TTLCache
+
+# Every cache made by @cached, with its in-flight queries, so invalidate() can clear a printer from all of them
+_caches = []
+
+
+def cached(ttl):
+    """Remember what a read-only printer query returned for `ttl` seconds
+
+    Dashboards poll the same endpoints over and over - with this, a burst of
+    polls only costs one round trip to the printer per interval.
+    Results are cached per printer (ip, port).
+
+    Calls that come in while the printer is still being asked don't send the
+    command again, they wait for that same answer.
+
+    Only use this on functions that take just printer_address and don't
+    change anything on the printer.
+    """
+    cache = TTLCache(maxsize=256, ttl=ttl)
+    # (ip, port) -> task that's asking the printer right now
+    in_flight = {}
+    _caches.append((cache, in_flight))
+
+    def decorator(func):
+        async def ask_printer(key, printer_address):
+            task = asyncio.current_task()
+            try:
+                result = await func(printer_address)
+                # Don't cache it if the printer was invalidated while we were asking
+                if in_flight.get(key) is task:
+                    cache[key] = result
+                return result
+            finally:
+                if in_flight.get(key) is task:
+                    del in_flight[key]
+
+        @functools.wraps(func)
+        async def wrapper(printer_address):
+            key = (printer_address['ip'], printer_address['port'])
+            try:
+                return cache[key]
+            except KeyError:
+                pass
+
+            task = in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(ask_printer(key, printer_address))
+                in_flight[key] = task
+            # shield() so one caller giving up doesn't cancel the query for everyone else
+            return await asyncio.shield(task)
+        return wrapper
+    return decorator
+
+
+def invalidate(printer_address):
+    """Throw away everything cached for a printer
+
+    Call this after sending anything that changes the printer's state
+    (moving, homing, pausing...) so the next read shows the new state.
+    A query that's still running keeps going for whoever already waits on
+    it, but new calls ask the printer again.
+    """
+    key = (printer_address['ip'], printer_address['port'])
+    for cache, in_flight in _caches:
+        cache.pop(key, None)
+        in_flight.pop(key, None)
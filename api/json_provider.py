@@ -0,0 +1,24 @@
+import orjson
+from quart.json.provider import JSONProvider
+
+
+class OrjsonProvider(JSONProvider):
+    """Makes jsonify() and request.get_json() use orjson instead of the stdlib json module
+
+    orjson is written in C and a lot faster, which adds up when a dashboard polls
+    temps and positions several times a second. It also produces bytes directly,
+    so responses skip the str -> bytes encode step.
+    """
+
+    # Same as the default provider - keys come out sorted
+    option = orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option), mimetype='application/json')
@@ -1,166 +1,351 @@
-import socket
-import struct
-import zlib
-
-BUFFER_SIZE = 1024  # How much data to read at once
-CHUNK_SIZE = 4096  # Upload files in 4KB chunks
-
-
-def send_and_receive(printer_address, command):
-    """The main communication function - send a command, get a response
-
-    How this works:
-    1. Connect to printer on port 8899
-    2. Send M601 S1 to wake it up and enable command mode
-    3. Wait for 'ok' response
-    4. Send your actual command
-    5. Wait for response with 'ok' at the end
-    6. Clean up and return
-    """
-    printer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    printer_socket.settimeout(10)  # Don't wait forever
-
-    try:
-        printer_socket.connect((printer_address['ip'], printer_address['port']))
-
-        # Wake up the printer - it ignores everything until you send this
-        init_command = '~M601 S1\r\n'
-        printer_socket.sendall(init_command.encode())
-
-        # Wait for initial 'ok' response
-        response = b''
-        while b'ok' not in response:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-
-        # Now send the actual command we care about
-        formatted_command = f'~{command}\r\n'  # Commands need ~ prefix and \r\n suffix
-        printer_socket.sendall(formatted_command.encode())
-
-        # Collect the response until we see 'ok'
-        response = b''
-        while True:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-            if b'ok\r\n' in response or b'ok\n' in response:
-                break
-
-        return response.decode('utf-8', errors='ignore')
-
-    finally:
-        printer_socket.close()
-
-
-def send_file(printer_address, filename, file_content):
-    """Upload a file to the printer - this is where the CRC fun happens
-
-    The protocol:
-    1. Connect and init with M601 S1
-    2. Send M650 (prepare for file transfer)
-    3. Send M28 with file size and path
-    4. Send file data in 4KB chunks with special headers
-    5. Send M29 to finish
-
-    Each chunk needs:
-    - Magic bytes (0x5a5aa5a5)
-    - Packet counter
-    - Chunk size (always 4096)
-    - CRC32 checksum
-    - The actual data (padded to 4096 bytes)
-    """
-    printer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    printer_socket.settimeout(30)  # File upload takes longer
-
-    try:
-        printer_socket.connect((printer_address['ip'], printer_address['port']))
-
-        # Same initialization dance as regular commands
-        init_command = '~M601 S1\r\n'
-        printer_socket.sendall(init_command.encode())
-        response = b''
-        while b'ok' not in response:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-
-        # Tell printer we're about to send a file
-        m650_cmd = '~M650\r\n'
-        printer_socket.sendall(m650_cmd.encode())
-        response = b''
-        while b'ok' not in response:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-
-        # Tell printer the file size and where to save it
-        # Format: M28 <size> 0:/user/<filename>
-        file_size = len(file_content)
-        m28_cmd = f'~M28 {file_size} 0:/user/{filename}\r\n'
-        printer_socket.sendall(m28_cmd.encode())
-        response = b''
-        while b'ok' not in response:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-
-        # Now the fun part - send the file in chunks
-        counter = 0  # Packet sequence number
-        offset = 0
-
-        while offset < file_size:
-            # Grab next chunk of actual data (might be less than 4KB at end)
-            chunk_end = min(offset + CHUNK_SIZE, file_size)
-            actual_data = file_content[offset:chunk_end]
-            actual_data_len = len(actual_data)
-
-            # Calculate CRC32 on the UNPADDED data
-            # This is important - CRC before padding!
-            crc = zlib.crc32(actual_data) & 0xffffffff
-
-            # NOW pad the data to 4096 bytes with zeros
-            data_chunk = actual_data + b'\x00' * (CHUNK_SIZE - actual_data_len)
-
-            # Build the packet header
-            # Format: magic(4 bytes) + counter(4 bytes) + length(4 bytes) + crc(4 bytes)
-            # Using >BBBBIII means big-endian, 4 individual bytes, then 3 unsigned ints
-            header = struct.pack('>BBBBIII',
-                                 0x5a, 0x5a, 0xa5, 0xa5,  # Magic bytes - printer checks these
-                                 counter,  # Which packet is this
-                                 CHUNK_SIZE,  # Always 4096
-                                 crc)  # CRC32 of unpadded data
-
-            # Send header + padded data as one packet
-            packet = header + data_chunk
-            printer_socket.sendall(packet)
-
-            # Give the printer a moment to breathe
-            # Without this, some printers get overwhelmed
-            import time
-            time.sleep(0.01)
-
-            offset = chunk_end
-            counter += 1
-
-        # Tell printer we're done sending data
-        m29_cmd = '~M29\r\n'
-        printer_socket.sendall(m29_cmd.encode())
-        response = b''
-        while b'ok' not in response:
-            chunk = printer_socket.recv(BUFFER_SIZE)
-            if not chunk:
-                break
-            response += chunk
-
-        return f'File {filename} uploaded successfully'
-
-    except Exception as e:
-        raise Exception(f'Upload failed: {str(e)}')
-    finally:
-        printer_socket.close()
\ No newline at end of file
+import asyncio
+import contextlib
+import socket
+import struct
+import time
+import zlib
+
+try:
+    # Optional: fastcrc uses the CPU's CRC instructions, several times faster than zlib
+    # Same CRC-32 (ISO-HDLC, the zlib polynomial) so the printer can't tell the difference
+    from fastcrc.crc32 import iso_hdlc as crc32
+except ImportError:
+    def crc32(data):
+        return zlib.crc32(data) & 0xffffffff
+
+CHUNK_SIZE = 4096  # Upload files in 4KB chunks
+ZERO_PADDING = bytes(CHUNK_SIZE)  # Sliced to pad the last chunk instead of building new zeros each time
+# Upload packet header: magic(4 bytes) + counter(4 bytes) + length(4 bytes) + crc(4 bytes)
+# >BBBBIII means big-endian, 4 individual bytes, then 3 unsigned ints
+PACKET_HEADER = struct.Struct('>BBBBIII')
+OK_TERMINATOR = b'ok\r\n'  # Every printer reply ends with this
+SEND_BUFFER_SIZE = 32768  # Small on purpose - uploads get paced by the printer reading, not by sleeps
+PRINTER_ERRORS = (b'error', b'fail')  # Printer replies containing one of these mean the command didn't work
+# Send M650 and M28 back to back before waiting for either reply - saves a round trip per upload
+# Off by default: the printer normally wants an 'ok' before the next command, only turn this
+# on if you've checked that your firmware handles it (uploads time out at the start if it doesn't)
+PIPELINE_UPLOAD_SETUP = False
+COMMAND_TIMEOUT = 10  # Don't wait forever
+UPLOAD_TIMEOUT = 30  # File upload takes longer
+MAX_CONNECTIONS = 64  # Most printer connections kept open at once - the least recently used gets closed first
+IDLE_CONNECTION_TIMEOUT = 300  # Close a printer's connection after it's gone unused this many seconds
+
+# Open connections, one per printer, keyed by (ip, port) -> (reader, writer)
+# The printer stays in command mode for as long as the connection is up
+_connections = {}
+# When each connection was last used, same keys - for closing idle ones
+_last_used = {}
+# One lock per printer so two requests never interleave on the same socket
+# Keyed by (ip, port) -> [lock, how many requests are using or waiting on it]
+_locks = {}
+
+
+def _tune_socket(printer_socket):
+    """Socket options every printer connection gets
+
+    TCP_NODELAY: our commands are a few bytes and we wait for the reply right
+    away, so Nagle would just sit on them for ~40ms before sending.
+    SO_KEEPALIVE: connections stay open between requests now, this is how we
+    find out a printer got switched off instead of hanging on it.
+    SO_SNDBUF: a small send buffer fills up as soon as the printer stops
+    reading, which is what slows uploads down when it can't keep up.
+    """
+    printer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    printer_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    printer_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+    # Default keepalive idle time is 2 hours - way too long to be useful
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        printer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+        printer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)
+        printer_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+
+
+def _printer_key(printer_address):
+    return printer_address['ip'], printer_address['port']
+
+
+@contextlib.asynccontextmanager
+async def _printer_lock(key):
+    """Hold a printer's lock for one request
+
+    The lock goes away again once nobody is using it and the printer has no
+    open connection, so printers we only talked to once don't pile up here.
+    """
+    entry = _locks.setdefault(key, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if key in _connections:
+            _last_used[key] = time.monotonic()
+        _forget_lock(key)
+
+
+def _forget_lock(key):
+    entry = _locks.get(key)
+    if entry is not None and entry[1] == 0 and key not in _connections:
+        del _locks[key]
+
+
+def _in_use(key):
+    return key in _locks and _locks[key][1] > 0
+
+
+def _close_idle_connections():
+    """Close connections nobody has used for IDLE_CONNECTION_TIMEOUT seconds"""
+    now = time.monotonic()
+    for key in list(_connections):
+        if not _in_use(key) and now - _last_used.get(key, 0) > IDLE_CONNECTION_TIMEOUT:
+            _drop_connection(key)
+
+
+def _make_room():
+    """Close the least recently used connections until there's room for one more
+
+    Connections a request is using right now are never touched, so with
+    every one of them busy the pool can briefly go over MAX_CONNECTIONS.
+    """
+    idle = sorted((key for key in _connections if not _in_use(key)), key=lambda key: _last_used.get(key, 0))
+    while len(_connections) >= MAX_CONNECTIONS and idle:
+        _drop_connection(idle.pop(0))
+
+
+async def _get_connection(key):
+    """Hand back the pooled connection for a printer, opening it if needed
+
+    A new connection gets its socket options tuned and the M601 S1 wake-up,
+    which only has to happen once per connection.
+
+    A pooled connection the printer hung up on while it sat idle (timeout,
+    reboot...) gets replaced here, before anything is written to it.
+    """
+    _close_idle_connections()
+
+    connection = _connections.get(key)
+    if connection is not None:
+        reader, writer = connection
+        if not (writer.is_closing() or reader.at_eof() or reader.exception() is not None):
+            return connection
+        _drop_connection(key)
+
+    _make_room()
+
+    reader, writer = await asyncio.open_connection(*key)
+    _tune_socket(writer.get_extra_info('socket'))
+
+    try:
+        # Wake up the printer - it ignores everything until you send this
+        init_command = '~M601 S1\r\n'
+        writer.write(init_command.encode())
+        await writer.drain()
+
+        # Wait for initial 'ok' response
+        await reader.readuntil(OK_TERMINATOR)
+    except BaseException:
+        writer.close()
+        raise
+
+    _connections[key] = reader, writer
+    return reader, writer
+
+
+def _drop_connection(key):
+    """Forget a printer's connection so the next call starts fresh"""
+    connection = _connections.pop(key, None)
+    _last_used.pop(key, None)
+    if connection is not None:
+        connection[1].close()
+    _forget_lock(key)
+
+
+async def send_and_receive(printer_address, command):
+    """The main communication function - send a command, get a response
+
+    How this works:
+    1. Grab the open connection to the printer (or connect on port 8899
+       and send M601 S1 to wake it up if there isn't one yet)
+    2. Send your actual command
+    3. Wait for response with 'ok' at the end
+    4. Return it as bytes, leaving the connection open for next time
+
+    A pooled connection that's already dead gets swapped for a fresh one
+    before the command is sent. If anything goes wrong after that, the
+    connection is thrown away and the error goes back to the caller - the
+    command is never resent, since the printer may already have run it.
+    The next call reconnects and re-sends M601 S1.
+    """
+    key = _printer_key(printer_address)
+    async with _printer_lock(key):
+        try:
+            return await asyncio.wait_for(_send_and_receive(key, command), COMMAND_TIMEOUT)
+        except BaseException:
+            _drop_connection(key)
+            raise
+
+
+async def _send_and_receive(key, command):
+    reader, writer = await _get_connection(key)
+
+    # Now send the actual command we care about
+    formatted_command = f'~{command}\r\n'  # Commands need ~ prefix and \r\n suffix
+    writer.write(formatted_command.encode())
+    await writer.drain()
+
+    # Collect the response until we see 'ok' - raw bytes, callers decode what they need
+    return await reader.readuntil(OK_TERMINATOR)
+
+
+async def send_file(printer_address, filename, stream, file_size):
+    """Upload a file to the printer - this is where the CRC fun happens
+
+    stream: file-like object to read the data from, file_size: how many bytes to send
+    The file gets read 4KB at a time as it goes out, never all at once
+
+    The protocol:
+    1. Connect and init with M601 S1 (skipped if already connected)
+    2. Send M650 (prepare for file transfer)
+    3. Send M28 with file size and path
+    4. Send file data in 4KB chunks with special headers
+    5. Send M29 to finish
+
+    Each chunk needs:
+    - Magic bytes (0x5a5aa5a5)
+    - Packet counter
+    - Chunk size (always 4096)
+    - CRC32 checksum
+    - The actual data (padded to 4096 bytes)
+    """
+    key = _printer_key(printer_address)
+    async with _printer_lock(key):
+        try:
+            return await _send_file(key, filename, stream, file_size)
+        except Exception as e:
+            _drop_connection(key)
+            raise Exception(f'Upload failed: {str(e)}')
+        except BaseException:
+            _drop_connection(key)
+            raise
+
+
+def _check_reply(reply, filename):
+    """Raise if a printer reply reports an error instead of success
+
+    The filename is left out of the check, replies echo it back and it
+    might well be called something like failsafe.gcode
+    """
+    if any(error in reply.replace(filename.encode(), b'').lower() for error in PRINTER_ERRORS):
+        raise ConnectionError(f'Printer replied: {reply.decode(errors="ignore").strip()}')
+
+
+def _check_upload(printer_reply, reader, writer):
+    """Raise if the printer said anything or hung up while we were sending the file
+
+    printer_reply is a read() that has been waiting since the upload started.
+    The printer stays quiet until M29, so if that read finished, the printer
+    either sent an error (maybe closing right after) or closed the connection.
+    """
+    if writer.is_closing() or reader.exception() is not None:
+        raise ConnectionError('Connection to the printer broke during upload')
+    if printer_reply.done() and not printer_reply.cancelled():
+        reply = printer_reply.result()  # Raises if the connection broke
+        if not reply:
+            raise ConnectionError('Printer closed the connection during upload')
+        raise ConnectionError(f'Printer interrupted the upload: {reply.decode(errors="ignore").strip()}')
+
+
+async def _send_file(key, filename, stream, file_size):
+    # Same connection (and M601 S1 handshake) as regular commands
+    reader, writer = await asyncio.wait_for(_get_connection(key), UPLOAD_TIMEOUT)
+
+    # Tell printer we're about to send a file
+    m650_cmd = '~M650\r\n'
+    # Tell printer the file size and where to save it
+    # Format: M28 <size> 0:/user/<filename>
+    m28_cmd = f'~M28 {file_size} 0:/user/{filename}\r\n'
+
+    if PIPELINE_UPLOAD_SETUP:
+        # Both commands in one go, then collect both 'ok's - saves a round trip
+        writer.write((m650_cmd + m28_cmd).encode())
+        await asyncio.wait_for(writer.drain(), UPLOAD_TIMEOUT)
+        _check_reply(await asyncio.wait_for(reader.readuntil(OK_TERMINATOR), UPLOAD_TIMEOUT), filename)
+        _check_reply(await asyncio.wait_for(reader.readuntil(OK_TERMINATOR), UPLOAD_TIMEOUT), filename)
+    else:
+        for setup_cmd in (m650_cmd, m28_cmd):
+            writer.write(setup_cmd.encode())
+            await asyncio.wait_for(writer.drain(), UPLOAD_TIMEOUT)
+            _check_reply(await asyncio.wait_for(reader.readuntil(OK_TERMINATOR), UPLOAD_TIMEOUT), filename)
+
+    # Now the fun part - send the file in chunks
+    counter = 0  # Packet sequence number
+    offset = 0
+    padding_view = memoryview(ZERO_PADDING)
+
+    # One packet buffer for the whole upload: header and data get written into it in place
+    packet = bytearray(PACKET_HEADER.size + CHUNK_SIZE)
+    data_view = memoryview(packet)[PACKET_HEADER.size:]
+
+    # write() may keep pointing at the packet if the socket can't take all of it yet.
+    # With a zero high-water mark drain() only returns once every byte is handed to the
+    # kernel, so the packet is safe to overwrite - and that's also what paces the upload
+    writer.transport.set_write_buffer_limits(high=0)
+    # Listen for the printer while sending - it has nothing to say until M29 unless something went wrong
+    printer_reply = asyncio.ensure_future(reader.read(1024))
+    try:
+        while offset < file_size:
+            # Read the next chunk straight from the stream (might be less than 4KB at end)
+            actual_data = stream.read(min(CHUNK_SIZE, file_size - offset))
+            actual_data_len = len(actual_data)
+            if not actual_data:
+                raise ValueError(f'File ended after {offset} of {file_size} bytes')
+            data_view[:actual_data_len] = actual_data
+
+            # Last chunk - pad the rest of the packet to 4096 bytes with zeros
+            if actual_data_len < CHUNK_SIZE:
+                data_view[actual_data_len:] = padding_view[actual_data_len:]
+
+            # Calculate CRC32 on the UNPADDED data
+            # This is important - CRC before padding!
+            crc = crc32(data_view[:actual_data_len])
+
+            # Fill in the packet header
+            PACKET_HEADER.pack_into(packet, 0,
+                                    0x5a, 0x5a, 0xa5, 0xa5,  # Magic bytes - printer checks these
+                                    counter,  # Which packet is this
+                                    CHUNK_SIZE,  # Always 4096
+                                    crc)  # CRC32 of unpadded data
+
+            writer.write(packet)
+
+            # No sleeping between chunks - if the printer can't keep up, the small send
+            # buffer fills and this waits until it has read more
+            await asyncio.wait_for(writer.drain(), UPLOAD_TIMEOUT)
+
+            offset += actual_data_len
+            counter += 1
+
+            # Stop as soon as the printer complains or hangs up, instead of sending the rest
+            _check_upload(printer_reply, reader, writer)
+    finally:
+        # Stop listening - anything that comes in after this stays in the reader for the M29 reply
+        printer_reply.cancel()
+        await asyncio.wait([printer_reply])
+        if not printer_reply.cancelled():
+            printer_reply.exception()  # Mark a broken connection as seen, we're already raising or about to
+        # Back to the defaults for regular commands on this connection
+        # (a closed one gets thrown away anyway, and uvloop won't touch its settings)
+        if not writer.is_closing():
+            writer.transport.set_write_buffer_limits()
+
+    # One last look, in case the printer spoke up right after the last chunk
+    _check_upload(printer_reply, reader, writer)
+
+    # Tell printer we're done sending data
+    m29_cmd = '~M29\r\n'
+    writer.write(m29_cmd.encode())
+    await asyncio.wait_for(writer.drain(), UPLOAD_TIMEOUT)
+    # A file the printer rejected still gets an 'ok' at the end, so read what it actually said
+    _check_reply(await asyncio.wait_for(reader.readuntil(OK_TERMINATOR), UPLOAD_TIMEOUT), filename)
+
+    return f'File {filename} uploaded successfully'
@@ -0,0 +1,184 @@
+"""Upload tests against a fake printer on localhost
+
+Every packet send_file puts on the wire gets checked: magic bytes, packet
+counter, length, CRC32 of the unpadded data and the zero padding.
+send_file reuses one packet buffer for the whole upload, so this also
+catches a packet getting overwritten before it was sent - that's what the
+slow printer test is for.
+
+Run from the repo root: python -m unittest discover tests (or pytest)
+Also runs everything on uvloop if it's installed.
+"""
+import asyncio
+import io
+import os
+import struct
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import socket_handler  # noqa: E402
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+MAGIC = b'\x5a\x5a\xa5\xa5'
+CHUNK_SIZE = 4096
+
+
+class FakePrinter:
+    """Just enough of the printer to take an upload
+
+    Replies 'ok' to every command and records each upload's packets
+    as (magic, counter, length, crc, payload) for the test to check.
+    Can also complain partway through an upload, or when it gets M29.
+    """
+
+    def __init__(self, read_delay=0, error_after=None, error=b'Error: CRC check failed\r\n',
+                 close_after_error=False, m29_reply=None):
+        self.read_delay = read_delay  # Seconds to wait before reading each packet
+        self.error_after = error_after  # Send `error` after this many packets
+        self.error = error
+        self.close_after_error = close_after_error  # ...and hang up right after it
+        self.m29_reply = m29_reply  # Reply to M29 instead of the usual one
+        self.commands = []
+        self.uploads = []
+        self.handlers = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        self.address = {'ip': '127.0.0.1', 'port': self.server.sockets[0].getsockname()[1]}
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        # Let the connection handlers see the client hang up and finish
+        await asyncio.gather(*self.handlers)
+
+    async def handle(self, reader, writer):
+        self.handlers.append(asyncio.current_task())
+        try:
+            while True:
+                command = (await reader.readuntil(b'\r\n')).strip().lstrip(b'~')
+                self.commands.append(command)
+                name = command.split()[0]
+                if name == b'M29' and self.m29_reply is not None:
+                    writer.write(self.m29_reply)
+                else:
+                    writer.write(b'CMD %s Received.\r\nok\r\n' % name)
+                await writer.drain()
+                if name == b'M28':
+                    self.uploads.append(await self.receive_file(reader, writer, int(command.split()[1])))
+                    if writer.is_closing():
+                        break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def receive_file(self, reader, writer, size):
+        packets = []
+        received = 0
+        while received < size:
+            if len(packets) == self.error_after:
+                writer.write(self.error)
+                await writer.drain()
+                if self.close_after_error:
+                    writer.close()
+                    return packets
+            if self.read_delay:
+                await asyncio.sleep(self.read_delay)
+            magic, counter, length, crc = struct.unpack('>4sIII', await reader.readexactly(16))
+            payload = await reader.readexactly(CHUNK_SIZE)
+            packets.append((magic, counter, length, crc, payload))
+            received += min(CHUNK_SIZE, size - received)
+        return packets
+
+
+class UploadTest(unittest.TestCase):
+    def new_loop(self):
+        return asyncio.new_event_loop()
+
+    def upload(self, data, printer, filename='test.gcode'):
+        async def run():
+            await printer.start()
+            try:
+                return await socket_handler.send_file(printer.address, filename, io.BytesIO(data), len(data))
+            finally:
+                # Connections are pooled - close ours before its event loop goes away
+                socket_handler._drop_connection(socket_handler._printer_key(printer.address))
+                await printer.stop()
+
+        loop = self.new_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    def check_packets(self, data, packets):
+        self.assertEqual(len(packets), -(-len(data) // CHUNK_SIZE))
+        for i, (magic, counter, length, crc, payload) in enumerate(packets):
+            chunk = data[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE]
+            self.assertEqual(magic, MAGIC)
+            self.assertEqual(counter, i)
+            self.assertEqual(length, CHUNK_SIZE)
+            self.assertEqual(crc, zlib.crc32(chunk), f'CRC of packet {i}')
+            self.assertEqual(payload, chunk + bytes(CHUNK_SIZE - len(chunk)), f'payload of packet {i}')
+
+    def test_packets(self):
+        for size in (0, 1, 4095, CHUNK_SIZE, CHUNK_SIZE + 1, 3 * CHUNK_SIZE + 123):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                printer = FakePrinter()
+                result = self.upload(data, printer)
+
+                self.assertEqual(result, 'File test.gcode uploaded successfully')
+                self.assertEqual(printer.commands[-3:], [b'M650', b'M28 %d 0:/user/test.gcode' % size, b'M29'])
+                self.assertEqual(len(printer.uploads), 1)
+                self.check_packets(data, printer.uploads[0])
+
+    def test_slow_printer(self):
+        # The printer reads slower than we send, so the socket buffers fill up, writes
+        # only go out partially and the packet buffer is still in use when the next chunk is ready
+        data = os.urandom(200 * CHUNK_SIZE + 17)
+        printer = FakePrinter(read_delay=0.001)
+        self.upload(data, printer)
+        self.check_packets(data, printer.uploads[0])
+
+    def test_printer_error_during_upload(self):
+        # Whether the printer hangs up after complaining or not, the upload must fail
+        for close_after_error in (False, True):
+            with self.subTest(close_after_error=close_after_error):
+                printer = FakePrinter(read_delay=0.001, error_after=2, close_after_error=close_after_error)
+                with self.assertRaisesRegex(Exception, 'Upload failed'):
+                    self.upload(os.urandom(200 * CHUNK_SIZE), printer)
+                self.assertNotIn(b'M29', printer.commands)
+
+    def test_printer_hangs_up_during_upload(self):
+        printer = FakePrinter(read_delay=0.001, error_after=2, error=b'', close_after_error=True)
+        with self.assertRaisesRegex(Exception, 'Upload failed'):
+            self.upload(os.urandom(200 * CHUNK_SIZE), printer)
+
+    def test_printer_error_on_m29(self):
+        printer = FakePrinter(m29_reply=b'CMD M29 Received.\r\nError: file write failed\r\nok\r\n')
+        with self.assertRaisesRegex(Exception, 'file write failed'):
+            self.upload(os.urandom(CHUNK_SIZE + 1), printer)
+
+    def test_filename_is_not_an_error(self):
+        printer = FakePrinter(m29_reply=b'CMD M29 Received.\r\nDone saving file: 0:/user/failsafe.gcode\r\nok\r\n')
+        result = self.upload(b'G28\n', printer, filename='failsafe.gcode')
+        self.assertEqual(result, 'File failsafe.gcode uploaded successfully')
+
+
+@unittest.skipIf(uvloop is None, 'uvloop not installed')
+class UvloopUploadTest(UploadTest):
+    def new_loop(self):
+        return uvloop.new_event_loop()
+
+
+if __name__ == '__main__':
+    unittest.main()